@@ -32,6 +32,10 @@ def get_db_connections():
     qdrant_client = vector_db.get_qdrant_client()
     neo4j_driver = knowledge_graph.get_neo4j_driver()
     vector_db.create_collection_if_not_exists(qdrant_client, QDRANT_COLLECTION_NAME)
+    # Pre-warm the cached LLM and embedding clients so the first user query
+    # doesn't pay their construction cost.
+    utils.get_llm()
+    utils.get_embedding_model()
     return qdrant_client, neo4j_driver
 
 try:
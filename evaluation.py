@@ -1,7 +1,6 @@
+import functools
+
 import pytest
-from deepeval import evaluate
-from deepeval.metrics import AnswerRelevancyMetric, FaithfulnessMetric, ContextualRecallMetric
-from deepeval.test_case import LLMTestCase
 
 # Import our custom modules
 import utils
@@ -14,13 +13,29 @@ import ingestion
 utils.load_environment()
 
 QDRANT_COLLECTION_NAME = "evaluation_collection"
-qdrant_client = vector_db.get_qdrant_client()
-neo4j_driver = knowledge_graph.get_neo4j_driver()
 
-# Define the models for evaluation
-relevancy_metric = AnswerRelevancyMetric(threshold=0.7, model="gpt-4", include_reason=True)
-faithfulness_metric = FaithfulnessMetric(threshold=0.7, model="gpt-4", include_reason=True)
-contextual_recall_metric = ContextualRecallMetric(threshold=0.7, model="gpt-4", include_reason=True)
+
+@functools.lru_cache(maxsize=1)
+def get_clients():
+    """Lazily initializes and caches the Qdrant client and Neo4j driver."""
+    qdrant_client = vector_db.get_qdrant_client()
+    neo4j_driver = knowledge_graph.get_neo4j_driver()
+    return qdrant_client, neo4j_driver
+
+@functools.lru_cache(maxsize=1)
+def get_metrics():
+    """
+    Lazily builds the DeepEval metrics.
+
+    deepeval is imported here rather than at module top-level so that merely
+    importing this file doesn't pay its (substantial) import cost.
+    """
+    from deepeval.metrics import AnswerRelevancyMetric, FaithfulnessMetric, ContextualRecallMetric
+
+    relevancy_metric = AnswerRelevancyMetric(threshold=0.7, model="gpt-4", include_reason=True)
+    faithfulness_metric = FaithfulnessMetric(threshold=0.7, model="gpt-4", include_reason=True)
+    contextual_recall_metric = ContextualRecallMetric(threshold=0.7, model="gpt-4", include_reason=True)
+    return [relevancy_metric, faithfulness_metric, contextual_recall_metric]
 
 def setup_test_environment():
     """
@@ -28,10 +43,11 @@ def setup_test_environment():
     This function should be run once before the evaluation.
     """
     print("--- Setting up test environment ---")
-    
+    qdrant_client, neo4j_driver = get_clients()
+
     # Ensure the Qdrant collection exists and is clean (optional, but good practice)
     vector_db.create_collection_if_not_exists(qdrant_client, QDRANT_COLLECTION_NAME)
-    
+
     # Create a dummy file with our test data
     test_data = """
     Dr. Evelyn Reed, a leading researcher at Innovate Dynamics, published a paper on Quantum RAG systems.
@@ -41,7 +57,7 @@ def setup_test_environment():
     test_file_path = "test_document.txt"
     with open(test_file_path, "w") as f:
         f.write(test_data)
-        
+
     # Ingest this file into our test collection
     ingestion.ingest_file(
         file_path=test_file_path,
@@ -56,6 +72,7 @@ def run_rag_pipeline(query: str):
     A helper function to run the full RAG pipeline for a given query.
     Returns the final answer and the retrieved context.
     """
+    qdrant_client, neo4j_driver = get_clients()
     context = hybrid_search.hybrid_retrieval(
         query, QDRANT_COLLECTION_NAME, qdrant_client, neo4j_driver
     )
@@ -63,62 +80,60 @@ def run_rag_pipeline(query: str):
     return answer, context
 
 # --- TEST CASES DEFINITION ---
+# Only the (query, expected_output) pairs live at module scope; the RAG
+# pipelines run inside the test function, not at import time.
 
-# 1. Factual Lookup Query
-query1 = "Who published the paper on Quantum RAG systems?"
-answer1, context1 = run_rag_pipeline(query1)
-test_case_1 = LLMTestCase(
-    input=query1,
-    actual_output=answer1,
-    expected_output="Dr. Evelyn Reed published the paper on Quantum RAG systems.",
-    retrieval_context=[context1],
-    context=[context1] # For faithfulness and recall
-)
-
-# 2. Relationship / Semantic Linkage Query
-query2 = "Who works for Innovate Dynamics?"
-answer2, context2 = run_rag_pipeline(query2)
-test_case_2 = LLMTestCase(
-    input=query2,
-    actual_output=answer2,
-    expected_output="Dr. Evelyn Reed works at Innovate Dynamics.",
-    retrieval_context=[context2],
-    context=[context2]
-)
-
-# 3. Summarization / Multi-hop Query
-query3 = "Where is the company that Dr. Ben Carter is associated with located?"
-answer3, context3 = run_rag_pipeline(query3)
-test_case_3 = LLMTestCase(
-    input=query3,
-    actual_output=answer3,
+EVALUATION_SCENARIOS = [
+    # 1. Factual Lookup Query
+    (
+        "Who published the paper on Quantum RAG systems?",
+        "Dr. Evelyn Reed published the paper on Quantum RAG systems.",
+    ),
+    # 2. Relationship / Semantic Linkage Query
+    (
+        "Who works for Innovate Dynamics?",
+        "Dr. Evelyn Reed works at Innovate Dynamics.",
+    ),
+    # 3. Summarization / Multi-hop Query
     # This answer requires connecting Ben Carter -> Paper -> Evelyn Reed -> Innovate Dynamics -> Geneva
-    expected_output="The company Dr. Ben Carter is associated with, Innovate Dynamics, is located in Geneva.",
-    retrieval_context=[context3],
-    context=[context3]
-)
+    (
+        "Where is the company that Dr. Ben Carter is associated with located?",
+        "The company Dr. Ben Carter is associated with, Innovate Dynamics, is located in Geneva.",
+    ),
+]
 
 # --- PYTEST EXECUTION ---
-@pytest.mark.parametrize(
-    "test_case",
-    [test_case_1, test_case_2, test_case_3]
-)
-def test_rag_system(test_case: LLMTestCase):
+@pytest.mark.parametrize("query,expected_output", EVALUATION_SCENARIOS)
+def test_rag_system(query: str, expected_output: str):
     """
     This is the actual test function that pytest will discover and run.
     It evaluates each test case against our defined metrics.
     """
+    from deepeval import evaluate
+    from deepeval.test_case import LLMTestCase
+
+    answer, context = run_rag_pipeline(query)
+    test_case = LLMTestCase(
+        input=query,
+        actual_output=answer,
+        expected_output=expected_output,
+        retrieval_context=[context],
+        context=[context]  # For faithfulness and recall
+    )
     evaluate(
         test_cases=[test_case],
-        metrics=[relevancy_metric, faithfulness_metric, contextual_recall_metric]
+        metrics=get_metrics()
     )
 
 # --- MAIN EXECUTION BLOCK ---
 if __name__ == "__main__":
+    from deepeval import evaluate
+    from deepeval.test_case import LLMTestCase
+
     print("Running evaluation suite...")
     # 1. Setup the data
     setup_test_environment()
-    
+
     # 2. Define all test cases
     # We re-run the pipeline here because the setup might have changed the state
     print("\n--- Generating outputs for test cases ---")
@@ -129,16 +144,16 @@ if __name__ == "__main__":
     query2 = "What is the project code for the Quantum RAG research?"
     answer2, context2 = run_rag_pipeline(query2)
     tc2 = LLMTestCase(input=query2, actual_output=answer2, retrieval_context=[context2], context=[context2], expected_output="The project code is QR-7.")
-    
+
     all_test_cases = [tc1, tc2]
 
     # 3. Run the evaluation
     print("\n--- Starting DeepEval Evaluation ---")
     evaluation_results = evaluate(
         test_cases=all_test_cases,
-        metrics=[relevancy_metric, faithfulness_metric, contextual_recall_metric],
+        metrics=get_metrics(),
         print_results=True,
     )
-    
+
     print("\n--- Evaluation complete. Tearing down. ---")
-    knowledge_graph.close_driver(neo4j_driver)
\ No newline at end of file
+    knowledge_graph.close_driver(get_clients()[1])
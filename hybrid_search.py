@@ -1,60 +1,112 @@
-import json
+import functools
+import re
+from concurrent.futures import ThreadPoolExecutor
+
+from langchain_core.messages import HumanMessage, SystemMessage
 
 import utils
 import vector_db
 import knowledge_graph
 
 
+# Static prompt parts live at module level as system messages. The variable
+# user part stays tiny, so providers that cache identical prompt prefixes
+# server-side skip re-processing the few-shot examples on every call.
+CYPHER_SYSTEM_PROMPT = """
+You are an expert Cypher query generator. Your task is to convert a user's
+natural language question into a Cypher query for a Neo4j graph.
+The graph has a simple schema: all nodes have the label `Entity` and a `name` property.
+Relationships are dynamic and represented by their type.
+
+Example 1:
+User Query: "What is the relationship between Project Phoenix and Alice?"
+Cypher Query:
+MATCH (p1:Entity {name: 'Project Phoenix'})-[r]-(p2:Entity {name: 'Alice'})
+RETURN p1.name AS Source, type(r) AS Relationship, p2.name AS Target
+
+Example 2:
+User Query: "Who works for Innovate Inc.?"
+Cypher Query:
+MATCH (p1:Entity)-[r:WORKS_FOR]->(p2:Entity {name: 'Innovate Inc.'})
+RETURN p1.name AS Person, p2.name AS Company
+
+Example 3:
+User Query: "What projects is Alice involved in?"
+Cypher Query:
+MATCH (p:Entity {name: 'Alice'})-[]-(project:Entity)
+RETURN project.name AS Project
+
+Respond with only the Cypher query.
+"""
+
+ANSWER_SYSTEM_PROMPT = """
+You are an intelligent assistant. Your task is to answer the user's question
+based *only* on the provided context. If the context does not contain the answer,
+say "I do not have enough information to answer this question."
+"""
+
+
 def _generate_graph_query(llm, user_query: str) -> str:
     """
     Uses an LLM to convert a natural language query into a Cypher query for Neo4j.
-    
+
     Args:
         llm: An initialized language model instance.
         user_query (str): The user's question in natural language.
-        
+
     Returns:
         str: A Cypher query string.
+
+    LLM failures propagate as exceptions rather than an empty string, so
+    the caching wrapper never memoizes a transient error as "no query".
     """
-    prompt = f"""
-    You are an expert Cypher query generator. Your task is to convert a user's
-    natural language question into a Cypher query for a Neo4j graph.
-    The graph has a simple schema: all nodes have the label `Entity` and a `name` property.
-    Relationships are dynamic and represented by their type.
-
-    Example 1:
-    User Query: "What is the relationship between Project Phoenix and Alice?"
-    Cypher Query:
-    MATCH (p1:Entity {{name: 'Project Phoenix'}})-[r]-(p2:Entity {{name: 'Alice'}})
-    RETURN p1.name AS Source, type(r) AS Relationship, p2.name AS Target
-
-    Example 2:
-    User Query: "Who works for Innovate Inc.?"
-    Cypher Query:
-    MATCH (p1:Entity)-[r:WORKS_FOR]->(p2:Entity {{name: 'Innovate Inc.'}})
-    RETURN p1.name AS Person, p2.name AS Company
-
-    Example 3:
-    User Query: "What projects is Alice involved in?"
-    Cypher Query:
-    MATCH (p:Entity {{name: 'Alice'}})-[]-(project:Entity)
-    RETURN project.name AS Project
-
-    Now, generate a Cypher query for the following user question:
-    ---
-    User Query: "{user_query}"
-    ---
-    Cypher Query:
+    response = llm.invoke([
+        SystemMessage(content=CYPHER_SYSTEM_PROMPT),
+        HumanMessage(content=f'User Query: "{user_query}"\nCypher Query:'),
+    ])
+    # Clean up the response to ensure it's just the query
+    return response.content.strip().replace("```cypher", "").replace("```", "")
+
+
+# Acronyms ("IBM", "NASA") or capitalized word runs ("Project Phoenix", "Alice").
+_ACRONYM_PATTERN = re.compile(r"\b[A-Z]{2,}\b")
+_ENTITY_PATTERN = re.compile(r"\b[A-Z][a-z]+(?:\s+[A-Z][a-z]+)*\b")
+
+def _has_graph_intent(user_query: str) -> bool:
     """
-    
-    try:
-        response = llm.invoke(prompt)
-        # Clean up the response to ensure it's just the query
-        return response.content.strip().replace("```cypher", "").replace("```", "")
-    except Exception as e:
-        print(f"Error generating Cypher query: {e}")
-        return ""
+    Cheap heuristic for whether a query is worth a graph lookup at all.
 
+    The knowledge graph only answers entity/relationship questions, so a
+    query with no entity mention at all (summaries, definitions, greetings)
+    can skip the LLM Cypher-generation round-trip entirely. Acronyms count
+    anywhere; for capitalized names, a sentence-initial single word alone
+    doesn't count — every question has one — unless it starts the query and
+    nothing else looks like an entity, in which case we err on the side of
+    querying the graph.
+    """
+    if _ACRONYM_PATTERN.search(user_query):
+        return True
+    matches = list(_ENTITY_PATTERN.finditer(user_query))
+    for match in matches:
+        if match.start() > 0 or " " in match.group():
+            return True
+    # A lone sentence-initial capitalized word ("Alice works where?") is
+    # ambiguous; attempting the graph query is the recall-safe choice.
+    return bool(matches)
+
+
+@functools.lru_cache(maxsize=1024)
+def _gen_cypher_cached(normalized_query: str) -> str:
+    """
+    Cached wrapper around `_generate_graph_query`.
+
+    Cypher generation is a pure function of the user query, so repeated (or
+    re-phrased but identically normalized) questions can skip the LLM
+    round-trip entirely. The cache lives for the process lifetime. Calls
+    that raise are not cached, so a transient LLM outage doesn't pin an
+    error result for the query.
+    """
+    return _generate_graph_query(utils.get_llm(), normalized_query)
 
 
 def hybrid_retrieval(user_query: str, collection_name: str, qdrant_client, neo4j_driver) -> str:
@@ -71,33 +123,50 @@ def hybrid_retrieval(user_query: str, collection_name: str, qdrant_client, neo4j
         str: A combined context string from both retrieval sources.
     """
     print("\n--- Starting Hybrid Retrieval ---")
-    
-    # 1. Semantic Search from Vector DB
-    print("Step 1: Performing semantic search...")
-    semantic_results = vector_db.semantic_search(
-        client=qdrant_client,
-        collection_name=collection_name,
-        query_text=user_query,
-        limit=3 # Retrieve top 3 chunks
-    )
+
+    def _semantic_branch():
+        print("Step 1: Performing semantic search...")
+        return vector_db.semantic_search(
+            client=qdrant_client,
+            collection_name=collection_name,
+            query_text=user_query,
+            limit=3 # Retrieve top 3 chunks
+        )
+
+    def _graph_branch():
+        print("Step 2: Performing structured search on knowledge graph...")
+        if not _has_graph_intent(user_query):
+            # Log the query itself so heuristic false negatives are visible.
+            print(f"No entity mentions detected; skipping graph query for: {user_query!r}")
+            return ""
+        # Normalize whitespace only -- lowercasing would mangle the case-sensitive
+        # entity names the LLM copies into the Cypher query.
+        try:
+            cypher_query = _gen_cypher_cached(" ".join(user_query.split()))
+        except Exception as e:
+            print(f"Error generating Cypher query: {e}")
+            return ""
+        if not cypher_query:
+            print("Could not generate a valid Cypher query.")
+            return ""
+        print(f"Generated Cypher Query: {cypher_query}")
+        # Streams records straight into a compact context string instead of
+        # materializing the result set twice (dicts here, JSON later).
+        return knowledge_graph.query_graph_as_text(neo4j_driver, cypher_query)
+
+    # The two branches are independent I/O (Qdrant vs LLM+Neo4j), so run them
+    # concurrently and pay max() of their latencies instead of the sum.
+    with ThreadPoolExecutor(max_workers=2) as executor:
+        semantic_future = executor.submit(_semantic_branch)
+        graph_future = executor.submit(_graph_branch)
+        semantic_results = semantic_future.result()
+        graph_context = graph_future.result()
+
     semantic_context = "\n".join([hit.payload['text'] for hit in semantic_results])
     print(f"Found {len(semantic_results)} semantic results.")
-    
-    # 2. Structured Search from Knowledge Graph
-    print("Step 2: Performing structured search on knowledge graph...")
-    llm = utils.get_llm()
-    cypher_query = _generate_graph_query(llm, user_query)
-    graph_context = ""
-    
-    if cypher_query:
-        print(f"Generated Cypher Query: {cypher_query}")
-        graph_results = knowledge_graph.query_graph(neo4j_driver, cypher_query)
-        print(f"Found {len(graph_results)} results from graph.")
-        if graph_results:
-            # Format graph results into a readable string
-            graph_context = "\n".join([json.dumps(record) for record in graph_results])
-    else:
-        print("Could not generate a valid Cypher query.")
+
+    if graph_context:
+        print(f"Found {len(graph_context.splitlines())} results from graph.")
 
     # 3. Combine contexts
     combined_context = f"""
@@ -129,11 +198,7 @@ def generate_response(query: str, context: str) -> str:
         str: The final, synthesized answer.
     """
     llm = utils.get_llm()
-    prompt = f"""
-    You are an intelligent assistant. Your task is to answer the user's question
-    based *only* on the provided context. If the context does not contain the answer,
-    say "I do not have enough information to answer this question."
-
+    user_prompt = f"""
     USER'S QUESTION:
     {query}
 
@@ -142,9 +207,12 @@ def generate_response(query: str, context: str) -> str:
 
     ANSWER:
     """
-    
+
     try:
-        answer = llm.invoke(prompt)
+        answer = llm.invoke([
+            SystemMessage(content=ANSWER_SYSTEM_PROMPT),
+            HumanMessage(content=user_prompt),
+        ])
         return answer.content.strip()
     except Exception as e:
         print(f"Error during final response generation: {e}")
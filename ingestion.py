@@ -1,6 +1,9 @@
+import hashlib
 import os
-import pypdf
+import shelve
 import json
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
 
 # Import our custom modules
 import utils
@@ -8,12 +11,42 @@ import vector_db
 import knowledge_graph
 
 
+# Below this page count the process pool's startup cost outweighs the win.
+_PDF_PARALLEL_MIN_PAGES = 8
+
+def _extract_pdf_page(args) -> str:
+    """
+    Worker that extracts the text of a single PDF page.
+
+    Runs in a separate process, so it reopens the file itself (pypdf readers
+    are not picklable across process boundaries).
+    """
+    import pypdf
+
+    file_path, page_index = args
+    reader = pypdf.PdfReader(file_path)
+    return reader.pages[page_index].extract_text() or ""
+
 def _extract_text_from_pdf(file_path: str) -> str:
-    """Extracts text content from a PDF file."""
+    """Extracts text content from a PDF file, parallelizing across pages."""
+    # Imported lazily so non-PDF ingests don't pay pypdf's import cost.
+    import pypdf
+
     try:
         reader = pypdf.PdfReader(file_path)
-        text = "".join(page.extract_text() for page in reader.pages)
-        return text
+        num_pages = len(reader.pages)
+
+        if num_pages < _PDF_PARALLEL_MIN_PAGES:
+            return "".join(page.extract_text() or "" for page in reader.pages)
+
+        # Page extraction is CPU-bound, so fan it out across processes.
+        # executor.map preserves page order in its results.
+        with ProcessPoolExecutor(max_workers=os.cpu_count()) as executor:
+            page_texts = executor.map(
+                _extract_pdf_page,
+                [(file_path, i) for i in range(num_pages)]
+            )
+            return "".join(page_texts)
     except Exception as e:
         print(f"Error reading PDF {file_path}: {e}")
         return ""
@@ -32,13 +65,53 @@ def _extract_text_from_image(file_path: str) -> str:
     return utils.ocr_from_image(file_path)
 
 def _transcribe_audio(file_path: str) -> str:
-    """Transcribes an audio file."""
-    # Note: This uses the simple speech_recognition library. For higher accuracy
-    # with various audio formats, integrating a local Whisper model would be better.
-    # This might require converting the input audio to .wav format first.
+    """Transcribes an audio file using the local faster-whisper model."""
     return utils.transcribe_audio(file_path)
 
 
+# Persistent cache of LLM entity-extraction results, keyed by chunk content
+# hash. Enterprise corpora repeat chunks heavily (boilerplate, re-uploaded
+# documents), and a cache hit replaces a full LLM round-trip.
+KG_CACHE_DIR = ".cache"
+# v2: values are JSON array strings from the batched extraction prompt.
+KG_CACHE_PATH = os.path.join(KG_CACHE_DIR, "kg_extraction_v2")
+
+# How many chunks share one extraction prompt. Small enough to keep the
+# combined prompt well inside the context window.
+KG_EXTRACTION_BATCH_SIZE = 8
+
+def _chunk_hash(chunk: str) -> str:
+    """Returns a short, stable content hash for a text chunk."""
+    return hashlib.blake2b(chunk.encode("utf-8"), digest_size=16).hexdigest()
+
+# In-memory LRU layer over the shelve cache: repeat chunks within a session
+# (the common case when several files share boilerplate) skip the disk read.
+_session_extraction_cache = OrderedDict()
+_SESSION_CACHE_MAX_ENTRIES = 4096
+
+def _session_cache_put(chunk_hash: str, result: str):
+    """Remembers an extraction result in the session LRU, evicting oldest."""
+    _session_extraction_cache[chunk_hash] = result
+    _session_extraction_cache.move_to_end(chunk_hash)
+    while len(_session_extraction_cache) > _SESSION_CACHE_MAX_ENTRIES:
+        _session_extraction_cache.popitem(last=False)
+
+def _is_valid_extraction(result) -> bool:
+    """
+    Revalidates a cached extraction result before trusting it.
+
+    Guards against stale or corrupt cache entries (e.g. written by an older
+    prompt format): anything that isn't a JSON array string is treated as a
+    cache miss and re-extracted.
+    """
+    if not isinstance(result, str):
+        return False
+    try:
+        return isinstance(json.loads(result), list)
+    except (json.JSONDecodeError, ValueError):
+        return False
+
+
 # --- MAIN INGESTION ORCHESTRATOR ---
 
 def ingest_file(file_path: str, collection_name: str, qdrant_client, neo4j_driver):
@@ -91,17 +164,94 @@ def ingest_file(file_path: str, collection_name: str, qdrant_client, neo4j_drive
     # 4. Upsert chunks to Qdrant (Vector Database)
     # We create metadata to link each chunk back to its source file
     metadatas = [{"source_file": filename, "chunk_index": i} for i in range(len(text_chunks))]
-    vector_db.upsert_chunks(qdrant_client, collection_name, text_chunks, metadatas)
+    # Pause HNSW indexing while the batch streams in so Qdrant indexes the
+    # file's chunks once at the end instead of re-indexing per upsert.
+    vector_db.suspend_indexing(qdrant_client, collection_name)
+    try:
+        vector_db.upsert_chunks(qdrant_client, collection_name, text_chunks, metadatas)
+    finally:
+        vector_db.resume_indexing(qdrant_client, collection_name)
 
     # 5. & 6. Extract entities and update Knowledge Graph
     print("Extracting entities and updating knowledge graph...")
     llm = utils.get_llm()
-    for i, chunk in enumerate(text_chunks):
-        print(f"Processing chunk {i+1}/{len(text_chunks)} for KG...")
-        # Get structured data (entities, relationships) from the LLM
-        structured_data_str = utils.extract_entities_and_relationships(chunk, llm)
-        
-        # Update the knowledge graph with the new data
+
+    # The LLM calls are network-bound, so we fan them out over a bounded thread
+    # pool instead of paying one round-trip per chunk sequentially. The pool size
+    # can be tuned via KG_EXTRACTION_WORKERS to respect provider rate limits.
+    # Results are cached on disk by content hash, so re-ingesting a document
+    # (or one sharing boilerplate chunks) skips the LLM entirely for known chunks.
+    max_workers = int(os.getenv("KG_EXTRACTION_WORKERS", "8"))
+    chunk_hashes = [_chunk_hash(chunk) for chunk in text_chunks]
+    os.makedirs(KG_CACHE_DIR, exist_ok=True)
+    with shelve.open(KG_CACHE_PATH) as extraction_cache:
+        # Resolve each hash through the session LRU first, then the disk
+        # cache; anything cached but invalid is evicted and re-extracted.
+        resolved = {}
+        for h in chunk_hashes:
+            if h in resolved:
+                continue
+            result = _session_extraction_cache.get(h)
+            if result is None:
+                result = extraction_cache.get(h)
+            if result is not None:
+                if _is_valid_extraction(result):
+                    resolved[h] = result
+                    _session_cache_put(h, result)
+                elif h in extraction_cache:
+                    del extraction_cache[h]
+
+        # Dedupe misses by content hash: identical chunks (boilerplate
+        # headers/footers repeated within one document) share a single
+        # extraction, and every index resolves through `resolved` below.
+        seen_miss_hashes = set()
+        miss_indices = []
+        for i, h in enumerate(chunk_hashes):
+            if h not in resolved and h not in seen_miss_hashes:
+                seen_miss_hashes.add(h)
+                miss_indices.append(i)
+        total_misses = sum(1 for h in chunk_hashes if h not in resolved)
+        print(f"Extracting entities from {len(miss_indices)} unique of {total_misses} "
+              f"uncached chunks ({len(text_chunks) - total_misses} cache hits) "
+              f"with {max_workers} workers...")
+
+        if miss_indices:
+            # Pack several chunks into each prompt (one LLM call per batch)
+            # and run the batches concurrently on the thread pool.
+            miss_batches = [
+                miss_indices[start:start + KG_EXTRACTION_BATCH_SIZE]
+                for start in range(0, len(miss_indices), KG_EXTRACTION_BATCH_SIZE)
+            ]
+            with ThreadPoolExecutor(max_workers=max_workers) as executor:
+                batch_results = list(executor.map(
+                    lambda batch: utils.extract_entities_batch(
+                        [text_chunks[i] for i in batch], llm
+                    ),
+                    miss_batches
+                ))
+            miss_results = [result for batch in batch_results for result in batch]
+            # Cache writes stay on the main thread; shelve isn't thread-safe.
+            # Failed batches come back as None — leave those out of both caches
+            # so a re-ingest retries them instead of trusting a poisoned "[]".
+            failed = 0
+            for i, result in zip(miss_indices, miss_results):
+                if result is None:
+                    failed += 1
+                    continue
+                extraction_cache[chunk_hashes[i]] = result
+                _session_cache_put(chunk_hashes[i], result)
+                resolved[chunk_hashes[i]] = result
+            if failed:
+                print(f"Entity extraction failed for {failed} chunks; "
+                      "they will be retried on the next ingestion of this file.")
+
+        structured_data_strs = [resolved.get(h) for h in chunk_hashes]
+
+    # Graph writes stay serial so Neo4j updates remain ordered
+    for i, structured_data_str in enumerate(structured_data_strs):
+        if structured_data_str is None:
+            continue
+        print(f"Updating KG from chunk {i+1}/{len(text_chunks)}...")
         knowledge_graph.update_graph_from_json(neo4j_driver, structured_data_str, filename)
     
     print(f"--- Finished ingestion for: {filename} ---")
@@ -17,46 +17,94 @@ def get_neo4j_driver():
         raise ValueError("Neo4j connection details not found in environment variables.")
     
     try:
-        driver = GraphDatabase.driver(uri, auth=(user, password))
+        # Pool settings tuned for the bursty ingestion workload: keep-alive
+        # avoids TCP reconnects between batches, and recycling connections
+        # hourly keeps them from going stale behind load balancers.
+        driver = GraphDatabase.driver(
+            uri,
+            auth=(user, password),
+            max_connection_pool_size=50,
+            connection_acquisition_timeout=60,
+            max_connection_lifetime=3600,
+            keep_alive=True,
+        )
         driver.verify_connectivity()
         print("Successfully connected to Neo4j.")
+        _ensure_schema(driver)
         return driver
     except Exception as e:
         print(f"Failed to connect to Neo4j: {e}")
         raise
 
+def _ensure_schema(driver):
+    """
+    Creates the schema constraint on :Entity(name) if it doesn't exist yet.
+
+    Without an index, every MERGE on :Entity triggers a full label scan, so
+    ingestion degrades to O(V^2) as the graph grows. The uniqueness constraint
+    gives MERGE an index lookup and also prevents duplicate entities when
+    concurrent writes race on the same name.
+    """
+    try:
+        with driver.session() as session:
+            session.run(
+                "CREATE CONSTRAINT entity_name_unique IF NOT EXISTS "
+                "FOR (n:Entity) REQUIRE n.name IS UNIQUE"
+            )
+    except Exception as e:
+        print(f"Warning: could not create :Entity(name) constraint: {e}")
+
 # --- GRAPH UPDATE LOGIC ---
 
-def _add_relationship_tx(tx, source, relationship, target):
+def _sanitize_relationship_type(relationship):
+    """Converts a free-text relationship into a valid Cypher relationship type."""
+    return relationship.upper().replace(" ", "_")
+
+def _add_relationships_apoc_tx(tx, rows):
     """
-    A transactional function to create nodes and relationships in Neo4j.
-    Uses MERGE to avoid creating duplicate entities.
-    
+    MERGEs a whole batch of relationships in one Cypher statement, using
+    apoc.merge.relationship so the relationship type is a parameter.
+
+    Interpolating the type into the query string creates one query text per
+    distinct type, each of which Neo4j must parse and plan separately
+    (polluting its query plan cache). With APOC the type travels in the row
+    data and one cached plan serves every batch.
+
     Args:
         tx: The Neo4j transaction object.
-        source (str): The name of the source entity.
-        relationship (str): The type of the relationship.
-        target (str): The name of the target entity.
+        rows (list[dict]): Dicts with 'source', 'target', and sanitized
+                           'rel_type' keys.
     """
-    # Use MERGE to find or create the source node. We'll give it a generic 'Entity' label.
-    # You could enhance this to use different labels for different entity types if known.
-    tx.run(
-        "MERGE (s:Entity {name: $source_name})",
-        source_name=source
-    )
-    # MERGE the target node
-    tx.run(
-        "MERGE (t:Entity {name: $target_name})",
-        target_name=target
-    )
-    # MERGE the relationship between the source and target nodes
     query = """
-    MATCH (s:Entity {name: $source_name})
-    MATCH (t:Entity {name: $target_name})
-    MERGE (s)-[r:%s]->(t)
-    """ % relationship.upper().replace(" ", "_") # Sanitize relationship type for Cypher
-    
-    tx.run(query, source_name=source, target_name=target)
+    UNWIND $rows AS row
+    MERGE (s:Entity {name: row.source})
+    MERGE (t:Entity {name: row.target})
+    WITH s, t, row
+    CALL apoc.merge.relationship(s, row.rel_type, {}, {}, t) YIELD rel
+    RETURN count(rel)
+    """
+    tx.run(query, rows=rows)
+
+def _add_relationships_tx(tx, rows_by_type):
+    """
+    Fallback used when APOC is not installed: MERGEs a document's
+    relationships inside one transaction, one UNWIND statement per
+    relationship type (the type cannot be parameterized in plain Cypher).
+
+    Args:
+        tx: The Neo4j transaction object.
+        rows_by_type (dict): Maps sanitized relationship type to a list of
+                             dicts with 'source' and 'target' entity names.
+    """
+    for rel_type, rows in rows_by_type.items():
+        query = """
+        UNWIND $rows AS row
+        MERGE (s:Entity {name: row.source})
+        MERGE (t:Entity {name: row.target})
+        MERGE (s)-[r:%s]->(t)
+        """ % rel_type
+
+        tx.run(query, rows=rows)
 
 def update_graph_from_json(driver, json_data, source_document_id):
     """
@@ -74,17 +122,37 @@ def update_graph_from_json(driver, json_data, source_document_id):
             print("Warning: JSON data is not a list. Skipping graph update.")
             return
 
-        with driver.session() as session:
-            for item in data:
-                source = item.get("source")
-                relationship = item.get("relationship")
-                target = item.get("target")
-
-                if all([source, relationship, target]):
-                    print(f"Adding to graph: {source} -> {relationship} -> {target}")
-                    session.execute_write(_add_relationship_tx, source, relationship, target)
-                else:
-                    print(f"Skipping malformed item: {item}")
+        # Group rows by sanitized relationship type so each type becomes a
+        # single UNWIND batch (one round-trip) instead of per-item writes.
+        rows_by_type = {}
+        for item in data:
+            source = item.get("source")
+            relationship = item.get("relationship")
+            target = item.get("target")
+
+            if all([source, relationship, target]):
+                print(f"Adding to graph: {source} -> {relationship} -> {target}")
+                rel_type = _sanitize_relationship_type(relationship)
+                rows_by_type.setdefault(rel_type, []).append(
+                    {"source": source, "target": target}
+                )
+            else:
+                print(f"Skipping malformed item: {item}")
+
+        if rows_by_type:
+            flat_rows = [
+                {"source": row["source"], "target": row["target"], "rel_type": rel_type}
+                for rel_type, rows in rows_by_type.items()
+                for row in rows
+            ]
+            with driver.session() as session:
+                try:
+                    session.execute_write(_add_relationships_apoc_tx, flat_rows)
+                except Exception as apoc_error:
+                    # APOC not installed on this server -- fall back to the
+                    # per-type query (one plan cache entry per rel type).
+                    print(f"APOC merge unavailable ({apoc_error}); falling back to per-type MERGE.")
+                    session.execute_write(_add_relationships_tx, rows_by_type)
         
         print("Graph update complete.")
     except json.JSONDecodeError:
@@ -113,6 +181,33 @@ def query_graph(driver, cypher_query):
         print(f"An error occurred during graph query: {e}")
         return []
 
+def query_graph_as_text(driver, cypher_query):
+    """
+    Executes a read-only Cypher query and formats the result as newline-
+    separated compact JSON, streaming records as the driver yields them.
+
+    Unlike `query_graph`, this never materializes the full result as a list
+    of dicts, and the compact separators keep the context string (and hence
+    the LLM prompt) as small as possible.
+
+    Args:
+        driver: The Neo4j driver instance.
+        cypher_query (str): The Cypher query to execute.
+
+    Returns:
+        str: One JSON object per line, or an empty string on error/no rows.
+    """
+    try:
+        with driver.session() as session:
+            result = session.run(cypher_query)
+            return "\n".join(
+                json.dumps(record.data(), separators=(",", ":"))
+                for record in result
+            )
+    except Exception as e:
+        print(f"An error occurred during graph query: {e}")
+        return ""
+
 # --- MAIN DRIVER LIFECYCLE ---
 
 def close_driver(driver):
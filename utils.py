@@ -1,15 +1,54 @@
+import asyncio
+import functools
+import hashlib
+import json
 import os
+import sqlite3
+import threading
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+
+import numpy as np
 from dotenv import load_dotenv
-from langchain_google_genai import ChatGoogleGenerativeAI, GoogleGenerativeAIEmbeddings
-from langchain_text_splitters import RecursiveCharacterTextSplitter
-import pytesseract
-from PIL import Image
-import speech_recognition as sr
+
+# The OCR, transcription, splitting, and LLM stacks are all imported lazily
+# inside the functions that need them: a process that only serves queries
+# never pays the import time or memory for the ingestion-side machinery.
+
+@functools.lru_cache(maxsize=1)
+def _tesserocr():
+    """
+    Returns the tesserocr module, or None if it isn't installed.
+
+    In-process C++ Tesseract binding: no subprocess fork or traineddata
+    reload per image, and it releases the GIL so OCR threads actually
+    run in parallel. Optional, since it needs the libtesseract headers.
+    """
+    try:
+        import tesserocr
+        return tesserocr
+    except ImportError:
+        return None
+
+@functools.lru_cache(maxsize=1)
+def _rust_splitter_cls():
+    """
+    Returns the semantic_text_splitter TextSplitter class, or None if the
+    optional package isn't installed.
+
+    Rust-backed splitter: all the string scanning happens in compiled
+    code, which moves chunking off the hot path for large corpora.
+    """
+    try:
+        from semantic_text_splitter import TextSplitter
+        return TextSplitter
+    except ImportError:
+        return None
 
 def load_environment():
     """Loads environment variables from a .env file."""
     load_dotenv()
 
+@functools.lru_cache(maxsize=1)
 def get_google_api_key():
     """Fetches the Google API key from environment variables."""
     api_key = os.getenv("GOOGLE_API_KEY")
@@ -17,13 +56,128 @@ def get_google_api_key():
         raise ValueError("GOOGLE_API_KEY not found in environment variables.")
     return api_key
 
+@functools.lru_cache(maxsize=1)
 def get_llm():
-    """Initializes and returns the Google Gemini LLM."""
+    """
+    Initializes and returns the Google Gemini LLM.
+
+    Cached so every caller shares one client instance (and its underlying
+    HTTP connection pool) instead of re-authenticating per query.
+    """
+    from langchain_google_genai import ChatGoogleGenerativeAI
+
     return ChatGoogleGenerativeAI(model="gemini-2.5-flash-lite", google_api_key=get_google_api_key(), temperature=0)
 
+@functools.lru_cache(maxsize=1)
 def get_embedding_model():
-    """Initializes and returns the Google embedding model."""
-    return GoogleGenerativeAIEmbeddings(model="models/gemini-embedding-001", google_api_key=get_google_api_key())
+    """
+    Initializes and returns the Google embedding model.
+
+    Cached for the same reason as `get_llm`: upsert_chunks and
+    semantic_search call this on every invocation, and rebuilding the
+    wrapper (and its HTTP client) per call adds avoidable latency to the
+    query hot path.
+    """
+    from langchain_google_genai import GoogleGenerativeAIEmbeddings
+
+    return GoogleGenerativeAIEmbeddings(model=EMBEDDING_MODEL_NAME, google_api_key=get_google_api_key())
+
+
+# --- EMBEDDING CACHE ---
+
+# Embedding a string costs a full API round-trip, so results are cached on
+# disk keyed by content hash. Vectors are stored as float16 bytes (half the
+# size of float32 with no practical effect on retrieval quality).
+EMBEDDING_MODEL_NAME = "models/gemini-embedding-001"
+# Gemini embeddings are Matryoshka-trained: the leading dimensions carry
+# most of the signal, so vectors can be truncated (and re-normalized) to
+# this many dims with negligible retrieval-quality loss. 1024 instead of
+# the native 3072 cuts vector storage and per-comparison FLOPs to a third.
+EMBEDDING_DIMENSIONS = 1024
+EMBEDDING_CACHE_PATH = os.path.join(".cache", "embeddings.sqlite3")
+
+# sqlite connections are shared across the upsert worker threads, so all
+# cache access is serialized through this lock.
+_embedding_cache_lock = threading.Lock()
+
+@functools.lru_cache(maxsize=1)
+def _get_embedding_cache():
+    """Opens (and initializes) the on-disk embedding cache."""
+    os.makedirs(os.path.dirname(EMBEDDING_CACHE_PATH), exist_ok=True)
+    conn = sqlite3.connect(EMBEDDING_CACHE_PATH, check_same_thread=False)
+    conn.execute("CREATE TABLE IF NOT EXISTS embeddings (key TEXT PRIMARY KEY, vector BLOB)")
+    conn.commit()
+    return conn
+
+def _embedding_cache_key(text, kind):
+    """
+    Cache key for one embedding.
+
+    Includes the model name (a model change must invalidate the cache) and
+    the embedding kind, since document and query embeddings differ for
+    task-aware models like Gemini's.
+    """
+    digest = hashlib.sha256(text.encode("utf-8")).hexdigest()
+    return f"{EMBEDDING_MODEL_NAME}:{kind}:{digest}"
+
+def _cache_get_many(keys):
+    """Returns a dict of key -> vector for the cached subset of `keys`."""
+    conn = _get_embedding_cache()
+    found = {}
+    with _embedding_cache_lock:
+        for key in keys:
+            row = conn.execute("SELECT vector FROM embeddings WHERE key = ?", (key,)).fetchone()
+            if row is not None:
+                found[key] = np.frombuffer(row[0], dtype=np.float16).astype(np.float32).tolist()
+    return found
+
+def _cache_set_many(items):
+    """Stores key -> vector pairs, converting vectors to float16 bytes."""
+    conn = _get_embedding_cache()
+    with _embedding_cache_lock:
+        conn.executemany(
+            "INSERT OR REPLACE INTO embeddings (key, vector) VALUES (?, ?)",
+            [(key, np.asarray(vector, dtype=np.float16).tobytes()) for key, vector in items],
+        )
+        conn.commit()
+
+def cached_embed_documents(model, texts):
+    """
+    Embeds documents through the on-disk cache.
+
+    Only texts whose content hash is not already cached hit the embedding
+    API; everything else is served from disk. Results come back in the
+    original order.
+
+    Args:
+        model: The embedding model instance.
+        texts (list[str]): The texts to embed.
+
+    Returns:
+        list[list[float]]: One embedding per input text.
+    """
+    keys = [_embedding_cache_key(text, "doc") for text in texts]
+    found = _cache_get_many(keys)
+
+    missing_indices = [i for i, key in enumerate(keys) if key not in found]
+    if missing_indices:
+        new_vectors = model.embed_documents([texts[i] for i in missing_indices])
+        new_items = [(keys[i], vector) for i, vector in zip(missing_indices, new_vectors)]
+        _cache_set_many(new_items)
+        found.update(new_items)
+
+    return [found[key] for key in keys]
+
+def cached_embed_query(model, text):
+    """Embeds a query through the on-disk cache (see cached_embed_documents)."""
+    key = _embedding_cache_key(text, "query")
+    found = _cache_get_many([key])
+    if key in found:
+        return found[key]
+
+    vector = model.embed_query(text)
+    _cache_set_many([(key, vector)])
+    return vector
 
 
 # --- TEXT PROCESSING ---
@@ -40,55 +194,176 @@ def chunk_text(text, chunk_size=1000, chunk_overlap=100):
     Returns:
         list[str]: A list of text chunks.
     """
-    text_splitter = RecursiveCharacterTextSplitter(
+    splitter = _get_splitter(chunk_size, chunk_overlap)
+    if _rust_splitter_cls() is not None:
+        return splitter.chunks(text)
+    return splitter.split_text(text)
+
+@functools.lru_cache(maxsize=8)
+def _get_splitter(chunk_size, chunk_overlap):
+    """
+    Builds and caches a splitter per (chunk_size, chunk_overlap).
+
+    Splitter construction compiles separator patterns, which is wasted work
+    when repeated once per document; the cache amortizes it across a run.
+    """
+    splitter_cls = _rust_splitter_cls()
+    if splitter_cls is not None:
+        # Same character-length semantics as the LangChain splitter
+        # (capacity/overlap measured with len), but in compiled Rust.
+        return splitter_cls(capacity=chunk_size, overlap=chunk_overlap)
+
+    from langchain_text_splitters import RecursiveCharacterTextSplitter
+
+    return RecursiveCharacterTextSplitter(
         chunk_size=chunk_size,
         chunk_overlap=chunk_overlap,
         length_function=len
     )
-    chunks = text_splitter.split_text(text)
-    return chunks
 
 # --- MULTIMODAL EXTRACTION ---
 
+# One Tesseract API instance per thread: PyTessBaseAPI is stateful
+# (SetImage/GetUTF8Text), so instances must not be shared across threads.
+_tess_local = threading.local()
+
+def _get_tess_api():
+    """Returns this thread's initialized PyTessBaseAPI instance."""
+    api = getattr(_tess_local, "api", None)
+    if api is None:
+        api = _tesserocr().PyTessBaseAPI(lang="eng")
+        _tess_local.api = api
+    return api
+
+def _ocr_one(image_path):
+    """
+    OCRs a single image.
+
+    Uses the in-process tesserocr API when available (the instance stays
+    initialized, so repeated calls skip engine startup and traineddata
+    loading); otherwise falls back to pytesseract's subprocess-per-call
+    path with its OpenMP threads capped, since Tesseract parallelizes
+    poorly beyond ~4 threads.
+    """
+    from PIL import Image
+
+    try:
+        with Image.open(image_path) as img:
+            if _tesserocr() is not None:
+                api = _get_tess_api()
+                api.SetImage(img)
+                return api.GetUTF8Text()
+            import pytesseract
+            os.environ.setdefault("OMP_THREAD_LIMIT", "4")
+            return pytesseract.image_to_string(img)
+    except Exception as e:
+        print(f"Error during OCR of {image_path}: {e}")
+        return ""
+
 def ocr_from_image(image_path):
     """
     Performs Optical Character Recognition (OCR) on an image file.
-    
+
     Requires Tesseract OCR engine to be installed on the system.
-    
+
     Args:
         image_path (str): The path to the image file.
-        
+
     Returns:
         str: The extracted text from the image.
     """
-    try:
-        with Image.open(image_path) as img:
-            text = pytesseract.image_to_string(img)
-            return text
-    except Exception as e:
-        print(f"Error during OCR: {e}")
-        return ""
+    return _ocr_one(image_path)
+
+def ocr_from_images(image_paths):
+    """
+    OCRs a batch of images in parallel.
+
+    With tesserocr, GetUTF8Text releases the GIL, so cheap threads scale
+    across cores with one resident API instance per thread. On the
+    pytesseract fallback, threads gain nothing (subprocess per call), so a
+    process pool with ~one worker per 4 cores keeps every core busy without
+    oversubscribing tesseract's internal threading.
+
+    Args:
+        image_paths (list[str]): Paths to the image files.
+
+    Returns:
+        list[str]: Extracted text, in the same order as `image_paths`.
+    """
+    if not image_paths:
+        return []
+    if len(image_paths) == 1:
+        return [_ocr_one(image_paths[0])]
+
+    max_workers = max(1, (os.cpu_count() or 1) // 4)
+    if _tesserocr() is not None:
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            return list(executor.map(_ocr_one, image_paths))
+    with ProcessPoolExecutor(max_workers=max_workers) as executor:
+        return list(executor.map(_ocr_one, image_paths))
+
+async def ocr_from_images_async(image_paths, concurrency=None):
+    """
+    Async variant of `ocr_from_images` for callers already inside an event
+    loop (e.g. an async ingestion endpoint), so outstanding OCR jobs overlap
+    without blocking the loop.
+
+    Each job runs `_ocr_one` on a worker thread — with tesserocr the heavy
+    OCR work releases the GIL, so this parallelizes like the thread-pool
+    path — and a semaphore bounds how many run at once.
+
+    Args:
+        image_paths (list[str]): Paths to the image files.
+        concurrency (int | None): Max OCR jobs in flight; defaults to
+                                  roughly one per 4 cores.
+
+    Returns:
+        list[str]: Extracted text, in the same order as `image_paths`.
+    """
+    if not image_paths:
+        return []
+
+    if concurrency is None:
+        concurrency = max(1, (os.cpu_count() or 1) // 4)
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def _bounded_ocr(path):
+        async with semaphore:
+            return await asyncio.to_thread(_ocr_one, path)
+
+    return list(await asyncio.gather(*(_bounded_ocr(path) for path in image_paths)))
+
+@functools.lru_cache(maxsize=1)
+def _get_whisper_model():
+    """
+    Loads the Whisper transcription model once and keeps it resident.
+
+    int8 weights halve the model's memory footprint and use the CPU's
+    integer dot-product instructions, so transcription runs locally at a
+    fraction of real time without any network dependency.
+    """
+    from faster_whisper import WhisperModel
+
+    return WhisperModel("base.en", device="cpu", compute_type="int8")
 
 def transcribe_audio(audio_path):
     """
-    Transcribes an audio file to text using Google's Web Speech API.
-    
-    Note: This is a simple implementation. For production, consider robust
-    services like OpenAI's Whisper, either via API or a local model.
-    
+    Transcribes an audio file to text using a local faster-whisper model.
+
+    Unlike the previous recognize_google approach, nothing is uploaded:
+    the int8-quantized Whisper model runs in-process, and voice-activity
+    detection skips silent stretches instead of decoding them.
+
     Args:
         audio_path (str): The path to the audio file (e.g., .wav).
-        
+
     Returns:
         str: The transcribed text.
     """
-    recognizer = sr.Recognizer()
     try:
-        with sr.AudioFile(audio_path) as source:
-            audio_data = recognizer.record(source)
-            text = recognizer.recognize_google(audio_data)
-            return text
+        model = _get_whisper_model()
+        segments, _info = model.transcribe(audio_path, vad_filter=True, beam_size=1)
+        return "".join(segment.text for segment in segments)
     except Exception as e:
         print(f"Error during audio transcription: {e}")
         return ""
@@ -136,10 +411,89 @@ def extract_entities_and_relationships(text, llm):
     
     try:
         response = llm.invoke(prompt)
-        return response
+        return _strip_code_fences(response.content)
     except Exception as e:
         print(f"Error during entity extraction: {e}")
         return "[]" # Return empty list as a string
 
+
+def _strip_code_fences(text):
+    """Removes markdown code fences the LLM sometimes wraps JSON in."""
+    return text.strip().removeprefix("```json").removeprefix("```").removesuffix("```").strip()
+
+def extract_entities_batch(texts, llm, max_retries=2):
+    """
+    Extracts entities and relationships from several text chunks with a
+    single LLM call.
+
+    Packing K chunks into one prompt amortizes the per-request latency over
+    the whole batch. The model is asked for one JSON object keyed by block
+    number; if the response doesn't parse, the error is fed back and the
+    call retried before giving up on the batch.
+
+    Keep batches small (~8 chunks) so the combined prompt stays well within
+    the context window and the model's per-block quality holds up.
+
+    Args:
+        texts (list[str]): The text chunks to process together.
+        llm: An initialized language model instance.
+        max_retries (int): How many times to retry on unparseable output.
+
+    Returns:
+        list[str | None]: One JSON array string of relationship triples per
+                          input text, in the same order as `texts`. Entries
+                          are None when the batch failed permanently, so
+                          callers can tell "extraction failed" apart from a
+                          genuine empty result and avoid caching the failure.
+    """
+    if not texts:
+        return []
+
+    blocks = "\n".join(f"--- TEXT {i + 1} ---\n{text}" for i, text in enumerate(texts))
+    prompt = f"""
+    From each numbered text below, extract named entities (like people,
+    organizations, locations) and the relationships between them.
+
+    Respond with a single JSON object whose keys are the text numbers
+    ("1" through "{len(texts)}") and whose values are lists of objects with
+    'source', 'relationship', and 'target'. Use an empty list for texts with
+    no extractable relationships. Respond with only the JSON object.
+
+    Example value for one text:
+    [
+      {{"source": "John Smith", "relationship": "WORKS_FOR", "target": "Acme Corp"}},
+      {{"source": "Acme Corp", "relationship": "LOCATED_IN", "target": "New York"}}
+    ]
+
+    {blocks}
+    """
+
+    error_feedback = ""
+    for _attempt in range(max_retries + 1):
+        try:
+            response = llm.invoke(prompt + error_feedback)
+            data = json.loads(_strip_code_fences(response.content))
+            if isinstance(data, dict):
+                return [json.dumps(data.get(str(i + 1), [])) for i in range(len(texts))]
+            error_feedback = (
+                f"\n\nYour previous response was:\n{response.content}\n"
+                "That is not a JSON object keyed by text number. Respond with "
+                "exactly that structure."
+            )
+        except json.JSONDecodeError as e:
+            # Retry-with-feedback: quote the failed output back so the model
+            # can see what it got wrong (each call is stateless).
+            error_feedback = (
+                f"\n\nYour previous response was:\n{response.content}\n"
+                f"It could not be parsed as JSON ({e}). "
+                "Respond with only the JSON object."
+            )
+        except Exception as e:
+            print(f"Error during batched entity extraction: {e}")
+            break
+
+    print("Batched entity extraction failed; marking this batch as unextracted.")
+    return [None] * len(texts)
+
 # You would call load_environment() at the start of your main script (app.py)
 # load_environment()
\ No newline at end of file
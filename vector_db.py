@@ -1,21 +1,44 @@
+import functools
+import hashlib
 import os
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
 from qdrant_client import QdrantClient, models
-from utils import get_embedding_model
+from utils import (
+    EMBEDDING_DIMENSIONS,
+    cached_embed_documents,
+    cached_embed_query,
+    get_embedding_model,
+)
 
 
+@functools.lru_cache(maxsize=1)
 def get_qdrant_client():
     """
     Initializes and returns the Qdrant client.
     Expects QDRANT_HOST and QDRANT_API_KEY to be set in the environment.
+
+    Cached so repeat callers share one client and its connection pool.
     """
     host = os.getenv("QDRANT_HOST")
     api_key = os.getenv("QDRANT_API_KEY")
+    grpc_port = int(os.getenv("QDRANT_GRPC_PORT", "6334"))
 
     if not host:
         raise ValueError("QDRANT_HOST not found in environment variables.")
 
-    # You can connect to a local Qdrant instance or Qdrant Cloud
-    client = QdrantClient(url=host, api_key=api_key)
+    # You can connect to a local Qdrant instance or Qdrant Cloud.
+    # prefer_grpc sends vectors as binary protobuf instead of JSON float
+    # lists — a large serialization and bandwidth saving at 3072 dims.
+    client = QdrantClient(
+        url=host,
+        api_key=api_key,
+        prefer_grpc=True,
+        grpc_port=grpc_port,
+        timeout=60,
+    )
     return client
 
 
@@ -27,39 +50,177 @@ def create_collection_if_not_exists(client: QdrantClient, collection_name: str):
         client (QdrantClient): The Qdrant client instance.
         collection_name (str): The name of the collection to create.
     """
+    # One idempotent create_collection call: no list-collections round-trip,
+    # and — unlike recreate_collection — it can never drop an existing
+    # collection's data if two processes race on startup.
     try:
-        collections = client.get_collections().collections
-        collection_names = [collection.name for collection in collections]
-
-        if collection_name not in collection_names:
-            print(f"Creating collection: {collection_name}")
-            # The vector size for OpenAI's text-embedding-ada-002 is 1536
-            # client.recreate_collection(
-            #     collection_name=collection_name,
-            #     vectors_config=models.VectorParams(size=1536, distance=models.Distance.COSINE),
-            # )
-            client.recreate_collection(
-                collection_name=collection_name,
-                vectors_config=models.VectorParams(size=3072, distance=models.Distance.COSINE),
-            )
-            print(f"Collection '{collection_name}' created successfully.")
-        else:
+        client.create_collection(
+            collection_name=collection_name,
+            # float16 on-disk originals halve storage and read bandwidth
+            # vs float32; searches run against the int8 in-RAM
+            # quantization below, with rescoring reading the originals.
+            # DOT instead of COSINE: vectors are unit-normalized on the
+            # client (see _normalize_rows), so dot product equals cosine
+            # similarity and the server skips its per-vector normalize.
+            vectors_config=models.VectorParams(
+                size=EMBEDDING_DIMENSIONS,
+                distance=models.Distance.DOT,
+                datatype=models.Datatype.FLOAT16,
+                on_disk=True,
+            ),
+            # int8 scalar quantization: ~4x less RAM per vector and faster
+            # scoring, with recall recovered via rescoring at search time.
+            quantization_config=models.ScalarQuantization(
+                scalar=models.ScalarQuantizationConfig(
+                    type=models.ScalarType.INT8,
+                    always_ram=True,
+                )
+            ),
+            # Explicit HNSW build parameters (these are Qdrant's defaults,
+            # pinned here so graph quality doesn't drift across versions).
+            hnsw_config=models.HnswConfigDiff(m=16, ef_construct=128, on_disk=False),
+        )
+        print(f"Collection '{collection_name}' created successfully.")
+    except Exception as e:
+        if "already exists" in str(e).lower():
             print(f"Collection '{collection_name}' already exists.")
+            _check_collection_config(client, collection_name)
+        else:
+            print(f"An error occurred while creating collection: {e}")
 
+    # Keyword index on the one metadata field callers filter by; without it
+    # a filtered search degenerates to a payload scan. Safe to re-run.
+    try:
+        client.create_payload_index(
+            collection_name=collection_name,
+            field_name="source_file",
+            field_schema="keyword",
+        )
     except Exception as e:
-        print(f"An error occurred while creating collection: {e}")
+        print(f"Warning: could not create payload index on source_file: {e}")
+
+def _check_collection_config(client: QdrantClient, collection_name: str):
+    """
+    Verifies an existing collection matches the vector config we upsert with.
+
+    Collections created by older versions of this module (3072 dims, COSINE)
+    would make every upsert and search fail a dimension check deep inside
+    try/except blocks, degrading to silently empty retrieval. Raising here
+    surfaces the mismatch at startup instead.
+
+    Raises:
+        ValueError: If the collection's vector size or distance differs from
+                    what this module produces.
+    """
+    try:
+        info = client.get_collection(collection_name=collection_name)
+        params = info.config.params.vectors
+    except Exception as e:
+        print(f"Warning: could not verify config of '{collection_name}': {e}")
+        return
+    if params.size != EMBEDDING_DIMENSIONS or params.distance != models.Distance.DOT:
+        raise ValueError(
+            f"Collection '{collection_name}' has vectors of size {params.size} "
+            f"with {params.distance} distance, but this build expects "
+            f"{EMBEDDING_DIMENSIONS} dims with Dot distance. Delete the "
+            "collection and re-ingest your documents."
+        )
+
 
 # --- DATA UPSERTION ---
 
-def upsert_chunks(client: QdrantClient, collection_name: str, chunks: list[str], metadatas: list[dict]):
+# Qdrant's default: segments are indexed once they exceed this many vectors.
+DEFAULT_INDEXING_THRESHOLD = 20000
+
+def suspend_indexing(client: QdrantClient, collection_name: str):
+    """
+    Pauses HNSW index building for a collection during bulk uploads.
+
+    Building the index while points stream in makes every upsert pay
+    re-indexing cost; pausing it and re-enabling afterwards lets Qdrant
+    index the whole batch once.
+    """
+    try:
+        client.update_collection(
+            collection_name=collection_name,
+            optimizer_config=models.OptimizersConfigDiff(indexing_threshold=0),
+        )
+    except Exception as e:
+        print(f"Warning: could not suspend indexing: {e}")
+
+def resume_indexing(client: QdrantClient, collection_name: str):
+    """Restores the default indexing threshold after a bulk upload."""
+    try:
+        client.update_collection(
+            collection_name=collection_name,
+            optimizer_config=models.OptimizersConfigDiff(
+                indexing_threshold=DEFAULT_INDEXING_THRESHOLD
+            ),
+        )
+    except Exception as e:
+        print(f"Warning: could not resume indexing: {e}")
+
+# Chunks are embedded and upserted this many at a time, so peak memory is
+# bounded by a few micro-batches of vectors rather than the whole document.
+UPSERT_BATCH_SIZE = 64
+
+def _normalize_rows(vectors):
+    """
+    Scales vectors to unit length (vectorized, works on a matrix or a
+    single vector).
+
+    Storing pre-normalized vectors with DOT distance gives the same ranking
+    as COSINE while sparing the server a normalize per inserted vector, and
+    what we read back is exactly what we stored.
+    """
+    matrix = np.asarray(vectors, dtype=np.float32)
+    norms = np.linalg.norm(matrix, axis=-1, keepdims=True)
+    return matrix / np.maximum(norms, 1e-12)
+
+def _prepare_vectors(vectors):
+    """
+    Matryoshka-truncates vectors to EMBEDDING_DIMENSIONS and re-normalizes.
+
+    The embedding cache keeps the full 3072-dim vectors, so lowering or
+    raising EMBEDDING_DIMENSIONS later doesn't invalidate it — only the
+    collection needs rebuilding.
+    """
+    matrix = np.asarray(vectors, dtype=np.float32)[..., :EMBEDDING_DIMENSIONS]
+    return _normalize_rows(matrix)
+
+def _chunk_point_id(chunk: str, metadata: dict) -> str:
+    """
+    Derives a deterministic point ID from the chunk content and its source.
+
+    Identical chunks from the same source always map to the same ID, so
+    re-ingesting a document overwrites its own points (instead of clobbering
+    unrelated ones, as the old enumerate-index IDs did) and lets us skip
+    re-embedding chunks that are already stored.
+    """
+    digest = hashlib.sha256(
+        (metadata.get("source_file", "") + chunk).encode("utf-8")
+    ).hexdigest()
+    return str(uuid.uuid5(uuid.NAMESPACE_URL, digest))
+# Micro-batches embed concurrently; the embedding API is network-bound, so
+# a handful of in-flight requests hides most of the per-call latency.
+EMBED_MAX_WORKERS = 8
+
+def upsert_chunks(client: QdrantClient, collection_name: str, chunks: list[str], metadatas: list[dict], batch_size: int = UPSERT_BATCH_SIZE, max_workers: int = EMBED_MAX_WORKERS):
     """
     Embeds text chunks and upserts them into a Qdrant collection.
 
+    Works in micro-batches: up to `max_workers` batches embed concurrently
+    (one batched embed-API call each), and finished batches are upserted in
+    order with wait=False so Qdrant ingests while later batches embed. Only
+    the final batch waits for the write to commit.
+
     Args:
         client (QdrantClient): The Qdrant client instance.
         collection_name (str): The name of the collection.
         chunks (list[str]): The list of text chunks to embed and store.
         metadatas (list[dict]): A list of metadata dictionaries, one for each chunk.
+        batch_size (int): How many chunks to embed and upsert per batch.
+        max_workers (int): How many embedding requests to keep in flight.
     """
     if not chunks:
         print("No chunks to upsert.")
@@ -67,35 +228,79 @@ def upsert_chunks(client: QdrantClient, collection_name: str, chunks: list[str],
 
     print(f"Upserting {len(chunks)} chunks to '{collection_name}'...")
     embedding_model = get_embedding_model()
-    
-    try:
-        # Embed all chunks in a single call for efficiency
-        vectors = embedding_model.embed_documents(chunks)
-
-        # Prepare points for Qdrant
-        points = [
-            models.PointStruct(
-                id=i,  # Using a simple integer ID. For production, consider UUIDs.
-                vector=vector,
-                payload={"text": chunk, **metadata}
-            )
-            for i, (vector, chunk, metadata) in enumerate(zip(vectors, chunks, metadatas))
-        ]
 
-        # Upsert in batches
-        client.upsert(
+    # Content-addressable IDs make re-ingestion idempotent: chunks already
+    # present in the collection are skipped before we pay for embeddings.
+    point_ids = [_chunk_point_id(chunk, metadata) for chunk, metadata in zip(chunks, metadatas)]
+    try:
+        existing = client.retrieve(
             collection_name=collection_name,
-            points=points,
-            wait=True  # Wait for the operation to complete
+            ids=point_ids,
+            with_payload=False,
+            with_vectors=False,
         )
-        print(f"Successfully upserted {len(chunks)} chunks.")
+        existing_ids = {str(point.id) for point in existing}
+    except Exception as e:
+        print(f"Warning: could not check for existing points: {e}")
+        existing_ids = set()
+
+    new_rows = [
+        (point_id, chunk, metadata)
+        for point_id, chunk, metadata in zip(point_ids, chunks, metadatas)
+        if point_id not in existing_ids
+    ]
+    if not new_rows:
+        print("All chunks already present; nothing to upsert.")
+        return
+    if len(new_rows) < len(chunks):
+        print(f"Skipping {len(chunks) - len(new_rows)} chunks already in the collection.")
+
+    batch_starts = range(0, len(new_rows), batch_size)
+    batches = [new_rows[start:start + batch_size] for start in batch_starts]
+
+    try:
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            # executor.map keeps batches in order, so ids/payloads line up.
+            # Embeddings become one contiguous float32 matrix per batch:
+            # ~28 bytes of boxed-float overhead per value disappears, and
+            # the client serializes arrays without a per-row Python loop.
+            vector_batches = executor.map(
+                lambda rows: _prepare_vectors(
+                    cached_embed_documents(embedding_model, [chunk for _, chunk, _ in rows])
+                ),
+                batches
+            )
+
+            for batch_index, (rows, vectors) in enumerate(zip(batches, vector_batches)):
+                # Columnar Batch layout (ids/vectors/payloads as parallel arrays)
+                # instead of a list of PointStruct objects — fewer per-point Python
+                # allocations and a cheaper conversion inside the client.
+                batch = models.Batch(
+                    ids=[point_id for point_id, _, _ in rows],
+                    vectors=vectors,
+                    payloads=[
+                        {"text": chunk, **metadata}
+                        for _, chunk, metadata in rows
+                    ],
+                )
+
+                client.upsert(
+                    collection_name=collection_name,
+                    points=batch,
+                    wait=(batch_index == len(batches) - 1)  # Only block on the last write
+                )
+        print(f"Successfully upserted {len(new_rows)} chunks.")
     except Exception as e:
         print(f"An error occurred during upsertion: {e}")
 
 
 # --- SEMANTIC SEARCH ---
 
-def semantic_search(client: QdrantClient, collection_name: str, query_text: str, limit: int = 5):
+# Payload fields returned by default: enough to build the context and cite
+# the source, without shipping back every metadata key per hit.
+DEFAULT_PAYLOAD_FIELDS = ("text", "source_file")
+
+def semantic_search(client: QdrantClient, collection_name: str, query_text: str, limit: int = 5, payload_fields=DEFAULT_PAYLOAD_FIELDS, embedding_model=None, hnsw_ef: int = None):
     """
     Performs a semantic search in a Qdrant collection.
 
@@ -104,28 +309,95 @@ def semantic_search(client: QdrantClient, collection_name: str, query_text: str,
         collection_name (str): The name of the collection to search in.
         query_text (str): The user's query text.
         limit (int): The maximum number of results to return.
+        payload_fields: Payload keys to return per hit, or None for all.
+        embedding_model: Optional model override; defaults to the cached
+                         process-wide singleton.
+        hnsw_ef (int): HNSW search beam width; defaults to max(64, limit*8).
 
     Returns:
         list: A list of search results (hit objects).
     """
     if not query_text:
         return []
-        
-    embedding_model = get_embedding_model()
-    
+
+    # Single queries ride the batched path with a one-element list.
+    results = semantic_search_batch(client, collection_name, [query_text], limit=limit, payload_fields=payload_fields, embedding_model=embedding_model, hnsw_ef=hnsw_ef)
+    return results[0] if results else []
+
+
+def semantic_search_batch(client: QdrantClient, collection_name: str, query_texts: list[str], limit: int = 5, payload_fields=DEFAULT_PAYLOAD_FIELDS, embedding_model=None, hnsw_ef: int = None):
+    """
+    Performs several semantic searches in one round-trip.
+
+    Useful for multi-query retrieval (query expansion, HyDE, multi-turn
+    context): query embeddings are served from the on-disk cache where
+    possible and all searches go to Qdrant via query_batch_points, so N
+    searches cost one HTTP round-trip instead of N. (client.search is
+    deprecated in recent qdrant-client releases; the Query API replaces it.)
+
+    Args:
+        client (QdrantClient): The Qdrant client instance.
+        collection_name (str): The name of the collection to search in.
+        query_texts (list[str]): The query texts to search for.
+        limit (int): The maximum number of results per query.
+        payload_fields: Payload keys to return per hit, or None for all.
+        embedding_model: Optional model override; defaults to the cached
+                         process-wide singleton.
+        hnsw_ef (int): HNSW search beam width; defaults to max(64, limit*8).
+
+    Returns:
+        list[list]: One list of search results (hit objects) per query,
+                    in the same order as `query_texts`.
+    """
+    if not query_texts:
+        return []
+
+    if embedding_model is None:
+        embedding_model = get_embedding_model()
+    if hnsw_ef is None:
+        # Wide enough for good recall at small limits, and it scales up
+        # with limit so large result sets don't starve the beam.
+        hnsw_ef = max(64, limit * 8)
+
+    # Fetch only the payload fields the caller needs — chunk texts are long,
+    # and returning the full payload inflates every response.
+    if payload_fields is None:
+        payload_selector = True
+    else:
+        payload_selector = models.PayloadSelectorInclude(include=list(payload_fields))
+
     try:
-        # Create a vector embedding for the query
-        query_vector = embedding_model.embed_query(query_text)
+        query_vectors = [
+            _prepare_vectors(cached_embed_query(embedding_model, text)).tolist()
+            for text in query_texts
+        ]
+
+        requests = [
+            models.QueryRequest(
+                query=vector,
+                limit=limit,
+                with_payload=payload_selector,
+                with_vector=False,  # Never ship 3072-dim vectors back
+                # Oversample and rescore with the original vectors so the
+                # quantized index doesn't cost us recall.
+                params=models.SearchParams(
+                    hnsw_ef=hnsw_ef,
+                    exact=False,
+                    quantization=models.QuantizationSearchParams(
+                        rescore=True,
+                        oversampling=2.0,
+                    )
+                ),
+            )
+            for vector in query_vectors
+        ]
 
-        # Perform the search
-        search_results = client.search(
+        responses = client.query_batch_points(
             collection_name=collection_name,
-            query_vector=query_vector,
-            limit=limit,
-            with_payload=True  # Include the metadata in the results
+            requests=requests,
         )
-        
-        return search_results
+        # Unwrap QueryResponse objects so callers keep getting hit lists.
+        return [response.points for response in responses]
     except Exception as e:
-        print(f"An error occurred during semantic search: {e}")
-        return []
\ No newline at end of file
+        print(f"An error occurred during batched semantic search: {e}")
+        return [[] for _ in query_texts]
\ No newline at end of file